@@ -1,12 +1,19 @@
 import streamlit as st
 from langchain_groq import ChatGroq
-from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from io import BytesIO
-from gtts import gTTS
 import base64
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
 from dotenv import load_dotenv
+from resilience import CircuitBreaker, CircuitOpenError
+from conversation import Conversation
+from usage import UsageMeter
+from pipeline import (TurnCancelled, start_turn, cancel_active_turn, pipeline_stage, stream_reply, fetch_speech,
+                      try_speech, mp3_duration, backend_health_panel, usage_panel, pipeline_stats_panel)
 load_dotenv()
 
 os.environ['LANGCHAIN_API_KEY'] = os.getenv("LANGCHAIN_API_KEY")
@@ -15,6 +22,10 @@ os.environ['LANGCHAIN_PROJECT'] = "AI Persona Chatbot"
 
 groq_api_key = os.getenv('GROQ_API_KEY')
 
+# Per-request deadlines in seconds; retries stop once twice this has elapsed
+llm_timeout = float(os.getenv("LLM_TIMEOUT", "20"))
+tts_timeout = float(os.getenv("TTS_TIMEOUT", "10"))
+
 system_prompt = """You are an AI persona inspired by Steve Jobs. You are NOT Steve Jobs, but you emulate his public communication style, personality, and design philosophy for educational and inspirational purposes.
 
 ============================================================
@@ -115,33 +126,131 @@ prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-if  "messages" not in st.session_state:
-    st.session_state.messages = []
+if "conversation" not in st.session_state:
+    st.session_state.conversation = Conversation()
 if "audio_response" not in st.session_state:
     st.session_state.audio_response = None
-
-def generate_response(question,model_name):
+if "render_stats" not in st.session_state:
+    st.session_state.render_stats = {"script_runs": 0, "html_bytes": 0}
+if "pipeline_stats" not in st.session_state:
+    st.session_state.pipeline_stats = {}
+if "active_turn" not in st.session_state:
+    st.session_state.active_turn = None
+if "usage" not in st.session_state:
+    st.session_state.usage = UsageMeter()
+
+# Only full runs execute this line; fragment reruns (a send or a Play click)
+# start inside their fragment. `loadtest.py --profile-sends` counts both per send
+st.session_state.render_stats["script_runs"] += 1
+
+@st.cache_resource
+def backend_breakers():
+    """Process-wide circuit breakers, one per backend"""
+    return {"llm": CircuitBreaker("Groq LLM"), "tts": CircuitBreaker("gTTS")}
+
+def generate_response(question,model_name,turn=None,on_chunk=None):
+    # Retries are done by call_with_retry so they share the breaker and deadline
     model = ChatGroq(model=model_name,
-                      groq_api_key=groq_api_key,)
-    output_parser=StrOutputParser()
-    chain = prompt|model|output_parser
-    answer = chain.invoke({
-        "question": question,
-        "chat_history": st.session_state.messages
-    })
-    return answer
-
-def text_to_speech(text):
-    try:
-        tts = gTTS(text=text, lang='en', slow=False)
-        audio_bytes = BytesIO()
-        tts.write_to_fp(audio_bytes)
-        audio_bytes.seek(0)
-        return audio_bytes.read()
-    except Exception as e:
-        st.error(f"Text-to-Speech conversion failed: {e}")
-        return None
-    
+                      groq_api_key=groq_api_key,
+                      timeout=llm_timeout,
+                      max_retries=0,)
+    # No StrOutputParser: the message chunks carry the token usage we meter
+    return stream_reply(prompt|model, question, system_prompt, model_name, backend_breakers()["llm"],
+                        deadline=2 * llm_timeout, turn=turn, on_chunk=on_chunk)
+
+# Frequent persona phrases and greetings, pre-rendered at startup ("|"-separated)
+warmup_phrases = [phrase.strip() for phrase in os.getenv(
+    "TTS_WARMUP_PHRASES",
+    "It just works.|Real artists ship.|Connecting the dots.|Stay hungry. Stay foolish.|"
+    "Simplicity is the ultimate sophistication.|Hello.|Welcome.|Great question."
+).split("|") if phrase.strip()]
+
+def normalize_phrase(text):
+    return re.sub(r"[^a-z0-9 ]", "", text.lower()).strip()
+
+def split_sentences(text):
+    return re.split(r"(?<=[.!?])\s+", text.strip())
+
+def synthesize(text, on_part=None):
+    return fetch_speech(text, backend_breakers()["tts"], tts_timeout, on_part)
+
+@st.cache_resource
+def audio_store():
+    """Process-wide phrase audio cache, filled by a background warm-up thread"""
+    store = {}
+    def warm_up():
+        for phrase in warmup_phrases:
+            for sentence in split_sentences(phrase):
+                try:
+                    store[normalize_phrase(sentence)] = synthesize(sentence)
+                except Exception:
+                    pass  # Best effort; the phrase is synthesized on demand instead
+    threading.Thread(target=warm_up, name="tts-warmup", daemon=True).start()
+    return store
+
+# Start the warm-up as soon as the process serves its first session
+audio_store()
+
+@st.cache_resource
+def tts_executor():
+    """Shared worker pool for synthesizing a reply's uncached runs side by side"""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="tts")
+
+def speech_segments(text):
+    """text as cached audio (bytes) and runs of uncached sentences (str), in order"""
+    store = audio_store()
+    segments = []
+    for sentence in split_sentences(text):
+        cached = store.get(normalize_phrase(sentence))
+        if cached:
+            segments.append(cached)
+        elif segments and isinstance(segments[-1], str):
+            segments[-1] += " " + sentence
+        else:
+            segments.append(sentence)
+    return segments
+
+def text_to_speech(text, on_part=None, on_lead=None):
+    """Reply audio, stitched from cached sentences and fresh synthesis; raises on failure
+
+    A reply with no cached sentence is one gTTS request, as before. When
+    cached sentences split it into several uncached runs, those are fetched
+    side by side and on_part runs as each one finishes. With on_lead, cached
+    audio that opens the reply is handed to it before anything is fetched,
+    and only the rest is returned.
+    """
+    # MP3 frames concatenate cleanly, so cached and fresh segments are stitched
+    segments = speech_segments(text)
+    lead = b""
+    if on_lead is not None:
+        while segments and isinstance(segments[0], bytes):
+            lead += segments.pop(0)
+        if lead:
+            on_lead(lead)
+    runs = [segment for segment in segments if isinstance(segment, str)]
+    started = time.monotonic()
+    if len(runs) == 1:
+        audio = {runs[0]: synthesize(runs[0], on_part)}
+    else:
+        # The workers can't touch the page, so progress is reported from here
+        futures = {run: tts_executor().submit(synthesize, run) for run in runs}
+        not_done = set(futures.values())
+        while not_done:
+            done, not_done = wait(not_done, timeout=0.1)
+            for future in done:
+                future.result()
+                if on_part is not None:
+                    on_part()
+        audio = {run: future.result() for run, future in futures.items()}
+    # Cached sentences cost nothing, so only freshly synthesized text is metered
+    st.session_state.usage.record_tts(sum(len(run) for run in runs), time.monotonic() - started)
+    return b"".join(audio[segment] if isinstance(segment, str) else segment for segment in segments)
+
+def render_html(html):
+    """Emit raw HTML (styles and chat markup) and count its bytes"""
+    st.session_state.render_stats["html_bytes"] += len(html.encode())
+    st.markdown(html, unsafe_allow_html=True)
+
 def autoplay_audio(audio_bytes):
     """Generate HTML for auto-playing audio"""
     if audio_bytes:
@@ -154,7 +263,7 @@ def autoplay_audio(audio_bytes):
         return audio_html
     return ""
 
-st.markdown("""
+render_html("""
 <style>
     /* Hide default streamlit elements */
     #MainMenu {visibility: hidden;}
@@ -298,7 +407,7 @@ st.markdown("""
     overflow: visible;
 }
 </style>
-""", unsafe_allow_html=True)
+""")
 
 st.sidebar.title("Settings")
 if "engine" not in st.session_state:
@@ -306,89 +415,174 @@ if "engine" not in st.session_state:
 
 llm_models = ["llama-3.1-8b-instant","llama-3.3-70b-versatile","openai/gpt-oss-safeguard-20b","moonshotai/kimi-k2-instruct-0905","qwen/qwen3-32b","groq/compound","groq/compound-mini","meta-llama/llama-4-maverick-17b-128e-instruct","meta-llama/llama-4-scout-17b-16e-instruct","meta-llama/llama-guard-4-12b","meta-llama/llama-prompt-guard-2-22m","meta-llama/llama-prompt-guard-2-86m"]
 
+previous_engine = st.session_state.engine
 st.session_state.engine = st.sidebar.selectbox("Select AI model", llm_models, index=0)
+if st.session_state.engine != previous_engine:
+    cancel_active_turn()
 
 st.sidebar.markdown("Voice Assistant Features")
 enable_tts = st.sidebar.checkbox("Enable Auto-play TTS", value=True)
 
+# A sidebar click is a full rerun, which interrupts an in-flight turn at its next
+# UI update; clicks inside the chat fragment would only queue behind it
+if st.sidebar.button("⏹ Stop generating"):
+    cancel_active_turn()
+
 if st.sidebar.button("Clear Chat History"):
-    st.session_state.messages = []
+    cancel_active_turn()
+    st.session_state.conversation = Conversation()
     st.session_state.audio_response = None
     st.rerun()
 
 st.title("AI Persona Chatbot - Steve Jobs🍎")
 
-message_container = st.container()
-
-with message_container:
-    # Display chat history
-    for idx, message in enumerate(st.session_state.messages):
-        if message["role"] == "user":
-            st.markdown(f"""
-            <div class="user-message">
-                <div class="message-content">{message["content"]}</div>
-                <div class="avatar user-avatar">U</div>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div class="assistant-message">
-                <div class="avatar assistant-avatar">SJ</div>
-                <div class="message-content">{message["content"]}</div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Add speaker button for each assistant message
-            col_speak, col_space = st.columns([1, 5])
-            with col_speak:
-                if st.button(f"🔊 Play", key=f"speak_{idx}"):
-                    with st.spinner("Generating audio..."):
-                        audio_bytes = text_to_speech(message["content"])
-                        if audio_bytes:
-                            st.audio(audio_bytes, format='audio/mp3')
-
-# Auto-play last audio response
-if enable_tts and st.session_state.audio_response:
-    st.markdown(autoplay_audio(st.session_state.audio_response), unsafe_allow_html=True)
-    st.session_state.audio_response = None
-
-# Add spacing for fixed input
-st.markdown("<div style='height: 100px;'></div>", unsafe_allow_html=True)
+@st.fragment
+def play_button(idx, content):
+    """Speaker button for one assistant message; clicking reruns only this fragment"""
+    col_speak, col_space = st.columns([1, 5])
+    with col_speak:
+        if st.button(f"🔊 Play", key=f"speak_{idx}"):
+            with st.spinner("Generating audio..."):
+                audio_bytes = try_speech(text_to_speech, content)
+                if audio_bytes:
+                    st.audio(audio_bytes, format='audio/mp3')
+
+def render_message(idx, message):
+    if message["role"] == "user":
+        render_html(f"""
+        <div class="user-message">
+            <div class="message-content">{message["content"]}</div>
+            <div class="avatar user-avatar">U</div>
+        </div>
+        """)
+    else:
+        render_html(f"""
+        <div class="assistant-message">
+            <div class="avatar assistant-avatar">SJ</div>
+            <div class="message-content">{message["content"]}</div>
+        </div>
+        """)
+        
+        # Add speaker button for each assistant message
+        play_button(idx, message["content"])
+
+def run_turn(user_input, enable_tts):
+    """Stream the reply for one question, then synthesize its audio"""
+    turn = start_turn()
+    render_message(len(st.session_state.conversation), {"role": "user", "content": user_input})
+    reply_placeholder = st.empty()
+    status = st.empty()
+
+    def show_partial(answer):
+        reply_placeholder.markdown(answer)
 
-# Input area at the bottom (will be fixed by CSS)
-# Use a form to handle Enter key submission
-with st.form(key="chat_form", clear_on_submit=True):
-    col1, col2 = st.columns([6, 1])
-    
-    with col1:
-        user_input = st.text_input(
-            "Message",
-            placeholder="Ask Steve Jobs about innovation, design, or leadership...",
-            key="user_input",
-            label_visibility="collapsed"
-        )
-    
-    with col2:
-        send_button = st.form_submit_button("Send", use_container_width=True)
-
-# Handle user input
-if send_button and user_input:
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    
-    # Generate response
-    with st.spinner("Thinking..."):
-        response = generate_response(user_input, model_name=st.session_state.engine)
-    
-    # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": response})
-    
-    # Generate audio response if TTS is enabled
-    if enable_tts:
-        with st.spinner("🔊 Generating audio..."):
-            st.session_state.audio_response = text_to_speech(response)
-    
-    # Rerun to update the UI
-    st.rerun()
-elif send_button and not user_input:
-    st.warning("Please enter a message before sending.")
\ No newline at end of file
+    try:
+        # Recall questions ("What's my name?") are answered without an API call
+        response = st.session_state.conversation.answer_locally(user_input)
+        if response is not None:
+            stats = st.session_state.pipeline_stats
+            stats["local_answered"] = stats.get("local_answered", 0) + 1
+        else:
+            with pipeline_stage("llm", turn):
+                # Generate response before recording the turn so the question isn't duplicated
+                response = generate_response(user_input, model_name=st.session_state.engine,
+                                             turn=turn, on_chunk=show_partial)
+        reply_placeholder.empty()
+
+        # Add both sides of the turn to chat history
+        st.session_state.conversation.append("user", user_input)
+        st.session_state.conversation.append("assistant", response)
+        render_message(len(st.session_state.conversation) - 1, {"role": "assistant", "content": response})
+
+        # Generate audio response if TTS is enabled
+        if enable_tts:
+            parts_done = 0
+
+            def show_progress():
+                nonlocal parts_done
+                turn.check()
+                parts_done += 1
+                status.caption(f"🔊 Generating audio... ({parts_done} parts)")
+
+            lead_ends = 0.0
+
+            def play_lead(audio):
+                # Cached opening phrases start playing while the rest is fetched
+                nonlocal lead_ends
+                render_html(autoplay_audio(audio))
+                lead_ends = time.monotonic() + mp3_duration(audio)
+
+            audio = try_speech(partial(text_to_speech, on_lead=play_lead), response, turn, on_part=show_progress)
+            status.empty()
+            if audio:
+                # Start the rest once the lead has played rather than over it
+                while time.monotonic() < lead_ends:
+                    turn.check()
+                    time.sleep(0.1)
+            st.session_state.audio_response = audio
+    except TurnCancelled:
+        reply_placeholder.empty()
+        status.caption("Stopped.")
+    except CircuitOpenError as e:
+        reply_placeholder.empty()
+        st.error(f"The model is unavailable right now ({e}). Please try again shortly.")
+    except Exception as e:
+        reply_placeholder.empty()
+        st.error(f"Response generation failed: {e}")
+    finally:
+        if st.session_state.active_turn is turn:
+            st.session_state.active_turn = None
+
+@st.fragment
+def chat_panel(enable_tts):
+    """Chat log, input form and audio player; a send reruns only this fragment"""
+    # Reserve slots above the form for the log and the stats, fill them once
+    # the input is handled so a send refreshes both
+    message_container = st.container()
+    stats_container = st.container()
+
+    # Add spacing for fixed input
+    render_html("<div style='height: 100px;'></div>")
+
+    # Input area at the bottom (will be fixed by CSS)
+    # Use a form to handle Enter key submission
+    with st.form(key="chat_form", clear_on_submit=True):
+        col1, col2 = st.columns([6, 1])
+        
+        with col1:
+            user_input = st.text_input(
+                "Message",
+                placeholder="Ask Steve Jobs about innovation, design, or leadership...",
+                key="user_input",
+                label_visibility="collapsed"
+            )
+        
+        with col2:
+            send_button = st.form_submit_button("Send", use_container_width=True)
+
+    with message_container:
+        # Display chat history
+        for idx, message in enumerate(st.session_state.conversation.messages):
+            render_message(idx, message)
+
+        # Handle user input, streaming the new turn below the history
+        if send_button and user_input:
+            run_turn(user_input, enable_tts)
+        elif send_button and not user_input:
+            st.warning("Please enter a message before sending.")
+
+        # Auto-play last audio response
+        if enable_tts and st.session_state.audio_response:
+            render_html(autoplay_audio(st.session_state.audio_response))
+            st.session_state.audio_response = None
+
+    with stats_container:
+        with st.expander("Render stats"):
+            stats = st.session_state.render_stats
+            st.markdown(f"Full script runs: {stats['script_runs']}")
+            st.markdown(f"Raw HTML sent: {stats['html_bytes'] / 1024:.1f} KB")
+        backend_health_panel(backend_breakers())
+        usage_panel(st.session_state.usage)
+        pipeline_stats_panel(st.session_state.pipeline_stats)
+
+chat_panel(enable_tts)
@@ -0,0 +1,38 @@
+"""Chat history shared by app.py and test.py
+
+Messages are kept both as UI dicts and as pre-converted LangChain messages,
+so building a prompt never re-walks the whole history. Facts the user states
+about themselves are pulled out as they arrive (see recall.py).
+"""
+from langchain_core.messages import HumanMessage, AIMessage
+
+from recall import answer_locally, extract_facts
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+class Conversation:
+    """Append-only chat history, kept pre-converted to LangChain messages"""
+    def __init__(self):
+        self.messages = []
+        self.chat_history = []
+        self.total_tokens = 0
+        self.facts = {}
+
+    def append(self, role, content):
+        message_cls = HumanMessage if role == "user" else AIMessage
+        self.messages.append({"role": role, "content": content})
+        self.chat_history.append(message_cls(content=content))
+        self.total_tokens += estimate_tokens(content)
+        if role == "user":
+            extract_facts(content, self.facts)
+
+    def answer_locally(self, question):
+        """Answer recall/repeat questions from stored facts, or None to ask the model"""
+        return answer_locally(question, self.facts, self.messages)
+
+    def __len__(self):
+        return len(self.messages)
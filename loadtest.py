@@ -0,0 +1,479 @@
+"""Concurrent-session load test for app.py
+
+Runs N simulated Streamlit sessions against app.py inside this one process,
+using streamlit's AppTest runner. Groq and gTTS are replaced by local stand-ins
+with configurable latency, so no API quota is used.
+
+Backend time is attributed to the session whose script run made the call, so
+send_overhead is each send's latency minus that send's own LLM/TTS time
+(TTS warm-up and Play calls don't count against it). AppTest.run() always
+executes the whole script, even for a click inside a fragment, so these
+latencies are what a full rerun costs; the fragment-scoped reruns app.py
+gets from a real browser are not exercised here.
+
+--profile-sends runs one session instead and scopes each rerun to the
+fragment that owns the clicked widget, the way the browser does, then
+reports script runs, fragment runs and ForwardMsg bytes per send. --app
+points either mode at another version of the script to compare against.
+
+Both modes patch private Streamlit internals (the runner's pending rerun,
+Runtime._instance, ScriptCache) and were written against streamlit 1.66;
+on a version where those have moved they stop with an error saying so.
+
+Usage:
+    python loadtest.py --sessions 20 --turns 10
+    python loadtest.py --sessions 50 --llm-latency 0.8 --json report.json
+    python loadtest.py --profile-sends --turns 5 --app old_app.py
+"""
+import argparse
+import dataclasses
+import json
+import logging
+import math
+import os
+import random
+import resource
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+import gtts
+import langchain_groq
+import streamlit
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import RunnableLambda
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import ScriptRunnerEvent, get_script_run_ctx
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+# app.py reads these at import; tracing uploads go to a closed local port
+os.environ.setdefault("GROQ_API_KEY", "loadtest")
+os.environ.setdefault("LANGCHAIN_API_KEY", "loadtest")
+os.environ["LANGCHAIN_ENDPOINT"] = "http://127.0.0.1:9"
+logging.getLogger("langsmith").setLevel(logging.CRITICAL)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+QUESTIONS = [
+    "My name is Alex.",
+    "How do I design a great product?",
+    "What's my name?",
+    "What does it take to ship?",
+    "How should a small team focus?",
+]
+REPLY = "It just works. Focus on the one thing that matters and say no to the rest."
+TESTED_STREAMLIT = "1.66"
+
+
+def require_internals(purpose, *attributes):
+    """Stop with a clear error if a Streamlit internal patched here has moved
+
+    attributes are (object, name) pairs.
+    """
+    missing = [f"{getattr(obj, '__name__', type(obj).__name__)}.{name}"
+               for obj, name in attributes if not hasattr(obj, name)]
+    if missing:
+        raise RuntimeError(f"{purpose} needs Streamlit internals that streamlit {streamlit.__version__} "
+                           f"does not have ({', '.join(missing)}); it was written against "
+                           f"streamlit {TESTED_STREAMLIT}")
+
+
+def current_session():
+    """Load-test session id of the script run calling in, or None off the script thread"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None or "loadtest_session" not in ctx.session_state:
+        return None
+    return ctx.session_state["loadtest_session"]
+
+
+class StageRecorder:
+    """Thread-safe latency samples, in-flight counts and backend time per session"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.in_flight = {}
+        self.peak_in_flight = {}
+        self.backend_seconds = {}
+
+    @contextmanager
+    def stage(self, name):
+        session = current_session()
+        if session is None:
+            # e.g. app.py's TTS warm-up thread, which no session waits on
+            name = f"{name}:background"
+        with self.lock:
+            self.in_flight[name] = self.in_flight.get(name, 0) + 1
+            self.peak_in_flight[name] = max(self.peak_in_flight.get(name, 0), self.in_flight[name])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.in_flight[name] -= 1
+                self.samples.setdefault(name, []).append(elapsed)
+                if session is not None:
+                    self.backend_seconds[session] = self.backend_seconds.get(session, 0.0) + elapsed
+
+    def record(self, name, elapsed):
+        with self.lock:
+            self.samples.setdefault(name, []).append(elapsed)
+
+    def session_backend_seconds(self, session):
+        with self.lock:
+            return self.backend_seconds.get(session, 0.0)
+
+
+recorder = StageRecorder()
+
+
+def install_stand_ins(llm_latency, tts_latency, tts_latency_per_char):
+    """Replace ChatGroq and gTTS with local sleeps of the given latency"""
+    def fake_chat_groq(model=None, groq_api_key=None, **kwargs):
+        def respond(prompt_value):
+            with recorder.stage("llm"):
+                time.sleep(random.uniform(0.5, 1.5) * llm_latency)
+            return AIMessageChunk(content=REPLY, usage_metadata={
+                "input_tokens": len(str(prompt_value)) // 4,
+                "output_tokens": len(REPLY) // 4,
+                "total_tokens": (len(str(prompt_value)) + len(REPLY)) // 4,
+            })
+        return RunnableLambda(respond)
+
+    class FakeGTTS:
+        def __init__(self, text, lang="en", slow=False, **kwargs):
+            self.text = text
+
+        def stream(self):
+            with recorder.stage("tts"):
+                time.sleep(tts_latency + tts_latency_per_char * len(self.text))
+            yield b"\xff\xf3" * 40 * len(self.text)
+
+        def write_to_fp(self, fp):
+            for chunk in self.stream():
+                fp.write(chunk)
+
+    langchain_groq.ChatGroq = fake_chat_groq
+    gtts.gTTS = FakeGTTS
+
+
+def share_runtime_across_sessions():
+    """Let concurrent AppTest runs share what a real server shares
+
+    AppTest sets up a fresh Runtime and ScriptCache for every run. It clears
+    the process-wide Runtime when a run ends, which breaks every other
+    session's run still in progress, so fall back to the last one it
+    installed. It also recompiles the script on every run, and ast.parse is
+    not thread-safe on Python 3.11 (concurrent runs fail with SystemError), so
+    compile once and share the bytecode like the server's ScriptCache does.
+    """
+    require_internals("Sharing the runtime across sessions", (Runtime, "_instance"), (Runtime, "instance"),
+                      (ScriptCache, "get_bytecode"))
+    last = {}
+    original_init = LocalScriptRunner.__init__
+    original_get_bytecode = ScriptCache.get_bytecode
+    bytecode = {}
+    compile_lock = threading.Lock()
+
+    def init(self, *args, **kwargs):
+        # Another session's run may already have cleared it again
+        if Runtime._instance is not None:
+            last["runtime"] = Runtime._instance
+        original_init(self, *args, **kwargs)
+
+    def instance(cls):
+        runtime = cls._instance or last.get("runtime")
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    def get_bytecode(self, script_path):
+        with compile_lock:
+            if script_path not in bytecode:
+                bytecode[script_path] = original_get_bytecode(self, script_path)
+            return bytecode[script_path]
+
+    LocalScriptRunner.__init__ = init
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: (cls._instance or last.get("runtime")) is not None)
+    ScriptCache.get_bytecode = get_bytecode
+
+
+class SendProfiler:
+    """Counts script runs and ForwardMsg bytes, scoping clicks to their fragment
+
+    A browser reruns only the fragment that owns a clicked widget; AppTest
+    always asks for a full rerun. The profiler learns which fragment each
+    widget was rendered in from the deltas and rewrites the pending rerun
+    to target that fragment.
+    """
+    def __init__(self):
+        self.widget_fragments = {}
+        self.target_fragment = None
+        self.reset()
+
+    def reset(self):
+        self.script_runs = 0
+        self.fragment_runs = 0
+        self.forward_msg_bytes = 0
+
+    def click(self, widget):
+        """Scope the next run to the fragment owning widget (a full run outside any)"""
+        widget.click()
+        self.target_fragment = self.widget_fragments.get(widget.id)
+
+    def on_event(self, sender, event, **kwargs):
+        if event == ScriptRunnerEvent.SCRIPT_STARTED:
+            if kwargs.get("fragment_ids_this_run"):
+                self.fragment_runs += 1
+            else:
+                self.script_runs += 1
+        elif event == ScriptRunnerEvent.ENQUEUE_FORWARD_MSG:
+            msg = kwargs["forward_msg"]
+            self.forward_msg_bytes += msg.ByteSize()
+            if msg.HasField("delta") and msg.delta.fragment_id and msg.delta.HasField("new_element"):
+                element = msg.delta.new_element
+                widget_id = getattr(getattr(element, element.WhichOneof("type")), "id", "")
+                if widget_id:
+                    self.widget_fragments[widget_id] = msg.delta.fragment_id
+
+    def install(self):
+        require_internals("Profiling sends", (LocalScriptRunner, "request_rerun"),
+                          (ScriptRunnerEvent, "ENQUEUE_FORWARD_MSG"))
+        profiler = self
+        original_init = LocalScriptRunner.__init__
+        original_request_rerun = LocalScriptRunner.request_rerun
+
+        def init(self, *args, **kwargs):
+            original_init(self, *args, **kwargs)
+            self.on_event.connect(profiler.on_event, weak=False)
+
+        def request_rerun(self, rerun_data):
+            requested = original_request_rerun(self, rerun_data)
+            if profiler.target_fragment is not None:
+                # The runner starts with a full-app rerun pending, which would
+                # absorb a fragment request, so rewrite the pending one instead
+                require_internals("Profiling sends", (self, "_requests"))
+                require_internals("Profiling sends", (self._requests, "_lock"), (self._requests, "_rerun_data"),
+                                  (self._requests._rerun_data, "fragment_id_queue"),
+                                  (self._requests._rerun_data, "is_fragment_scoped_rerun"))
+                with self._requests._lock:
+                    self._requests._rerun_data = dataclasses.replace(
+                        self._requests._rerun_data, fragment_id_queue=[profiler.target_fragment],
+                        is_fragment_scoped_rerun=True)
+                profiler.target_fragment = None
+            return requested
+
+        LocalScriptRunner.__init__ = init
+        LocalScriptRunner.request_rerun = request_rerun
+
+
+def profile_sends(app_path, turns, timeout):
+    """Send turns questions in one session and measure what each send costs"""
+    profiler = SendProfiler()
+    profiler.install()
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    start = time.perf_counter()
+    at.run()
+    initial = {"seconds": time.perf_counter() - start, "script_runs": profiler.script_runs,
+               "fragment_runs": profiler.fragment_runs, "forward_msg_bytes": profiler.forward_msg_bytes}
+    sends = []
+    for turn in range(turns):
+        profiler.reset()
+        at.text_input(key="user_input").input(QUESTIONS[turn % len(QUESTIONS)])
+        profiler.click(find_button(at, "Send"))
+        start = time.perf_counter()
+        at.run()
+        sends.append({"seconds": time.perf_counter() - start, "script_runs": profiler.script_runs,
+                      "fragment_runs": profiler.fragment_runs, "forward_msg_bytes": profiler.forward_msg_bytes,
+                      "error": at.exception[0].message if at.exception else None})
+    return {"app": app_path, "initial_load": initial, "sends": sends}
+
+
+def print_profile(profile):
+    initial = profile["initial_load"]
+    print(f"App: {profile['app']}")
+    print(f"Initial load: {initial['script_runs']} script runs, {initial['forward_msg_bytes'] / 1024:.1f} KB")
+    print(f"{'send':<6}{'script runs':>13}{'fragment runs':>15}{'KB sent':>10}{'ms':>10}")
+    for i, send in enumerate(profile["sends"], 1):
+        print(f"{i:<6}{send['script_runs']:>13}{send['fragment_runs']:>15}"
+              f"{send['forward_msg_bytes'] / 1024:>10.1f}{send['seconds'] * 1000:>10.0f}")
+        if send["error"]:
+            print(f"      error: {send['error']}")
+    if profile["sends"]:
+        mean_kb = statistics.mean(send["forward_msg_bytes"] for send in profile["sends"]) / 1024
+        print(f"Mean per send: {mean_kb:.1f} KB")
+
+
+def sample_process(stop, interval, timeline):
+    """Record process CPU time and RSS until stop is set"""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    start = time.perf_counter()
+    while not stop.wait(interval):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        with open("/proc/self/statm") as statm:
+            rss_pages = int(statm.read().split()[1])
+        timeline.append({
+            "t": round(time.perf_counter() - start, 3),
+            "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+            "rss_mb": round(rss_pages * page_size / 2**20, 1),
+        })
+
+
+def find_button(at, label):
+    return next(button for button in at.button if button.label == label)
+
+
+def run_session(app_path, session_id, turns, think_time, timeout, errors):
+    """One simulated user: send, press Play and toggle TTS at random"""
+    rng = random.Random(session_id)
+    try:
+        at = AppTest.from_file(app_path, default_timeout=timeout)
+        at.session_state["loadtest_session"] = session_id
+        start = time.perf_counter()
+        at.run()
+        recorder.record("action:initial_load", time.perf_counter() - start)
+        sent = 0
+        for _ in range(turns):
+            time.sleep(rng.uniform(0, think_time))
+            roll = rng.random()
+            play_keys = [button.key for button in at.button if (button.key or "").startswith("speak_")]
+            if roll < 0.7 or not play_keys:
+                action = "send"
+                at.text_input(key="user_input").input(QUESTIONS[sent % len(QUESTIONS)])
+                find_button(at, "Send").click()
+                sent += 1
+            elif roll < 0.9:
+                action = "play"
+                at.button(key=rng.choice(play_keys)).click()
+            else:
+                action = "toggle_tts"
+                checkbox = next(box for box in at.sidebar.checkbox if box.label == "Enable Auto-play TTS")
+                checkbox.set_value(not checkbox.value)
+            backend_before = recorder.session_backend_seconds(session_id)
+            start = time.perf_counter()
+            at.run()
+            elapsed = time.perf_counter() - start
+            recorder.record(f"action:{action}", elapsed)
+            if action == "send":
+                backend = recorder.session_backend_seconds(session_id) - backend_before
+                recorder.record("send_overhead", elapsed - backend)
+            if at.exception:
+                errors.append(f"session {session_id}: {at.exception[0].message}")
+    except Exception as e:
+        errors.append(f"session {session_id}: {e!r}")
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile: the smallest sample with pct% of samples at or below it"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 1),
+        "p50_ms": round(percentile(samples, 50) * 1000, 1),
+        "p95_ms": round(percentile(samples, 95) * 1000, 1),
+        "p99_ms": round(percentile(samples, 99) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def build_report(args, wall_time, timeline, errors):
+    stages = {name: summarize(samples) for name, samples in sorted(recorder.samples.items())}
+    actions = sum(len(samples) for name, samples in recorder.samples.items() if name.startswith("action:"))
+    # Time spent in a send that isn't that send's backend service time is script
+    # execution or waiting for the GIL / runner threads, i.e. queueing in the process
+    queueing = {}
+    if "send_overhead" in stages:
+        queueing["send_overhead_mean_ms"] = stages["send_overhead"]["mean_ms"]
+        queueing["send_overhead_p95_ms"] = stages["send_overhead"]["p95_ms"]
+    queueing["peak_in_flight"] = dict(recorder.peak_in_flight)
+    return {
+        "config": vars(args),
+        "wall_time_s": round(wall_time, 2),
+        "throughput_actions_per_s": round(actions / wall_time, 2) if wall_time else 0.0,
+        "stages": stages,
+        "queueing": queueing,
+        "process": timeline,
+        "errors": errors,
+    }
+
+
+def print_report(report):
+    print(f"Sessions: {report['config']['sessions']}  Turns: {report['config']['turns']}  "
+          f"Wall time: {report['wall_time_s']}s  Throughput: {report['throughput_actions_per_s']} actions/s")
+    print(f"{'stage':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in report["stages"].items():
+        print(f"{name:<22}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    print(f"Queueing: {report['queueing']}")
+    if report["process"]:
+        last = report["process"][-1]
+        peak_rss = max(sample["rss_mb"] for sample in report["process"])
+        print(f"CPU time: {last['cpu_s']}s  Peak RSS: {peak_rss} MB")
+    if report["errors"]:
+        print(f"Errors ({len(report['errors'])}):")
+        for error in report["errors"][:10]:
+            print(f"  {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=10, help="actions per session")
+    parser.add_argument("--think-time", type=float, default=0.5, help="max seconds between actions")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="mean stand-in LLM latency (s)")
+    parser.add_argument("--tts-latency", type=float, default=0.2, help="stand-in TTS base latency (s)")
+    parser.add_argument("--tts-latency-per-char", type=float, default=0.002, help="stand-in TTS latency per character (s)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-run script timeout (s)")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="CPU/RSS sampling interval (s)")
+    parser.add_argument("--json", help="write the full report to this path")
+    parser.add_argument("--app", default=APP_PATH, help="script to run instead of app.py")
+    parser.add_argument("--profile-sends", action="store_true",
+                        help="measure script runs and bytes sent per send in a single session")
+    args = parser.parse_args()
+    app_path = os.path.abspath(args.app)
+
+    install_stand_ins(args.llm_latency, args.tts_latency, args.tts_latency_per_char)
+    if args.profile_sends:
+        profile = profile_sends(app_path, args.turns, args.timeout)
+        print_profile(profile)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(profile, f, indent=2)
+        return
+    share_runtime_across_sessions()
+
+    stop = threading.Event()
+    timeline = []
+    sampler = threading.Thread(target=sample_process, args=(stop, args.sample_interval, timeline), daemon=True)
+    sampler.start()
+
+    errors = []
+    sessions = [
+        threading.Thread(target=run_session, args=(app_path, i, args.turns, args.think_time, args.timeout, errors))
+        for i in range(args.sessions)
+    ]
+    start = time.perf_counter()
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join()
+    wall_time = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+
+    report = build_report(args, wall_time, timeline, errors)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Turn cancellation, streaming and speech calls, metering and the stats panels
+
+Shared by app.py and test.py. Everything here works on the current session:
+the active turn, conversation, pipeline stats and usage meter live in
+st.session_state under "active_turn", "conversation", "pipeline_stats" and
+"usage".
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from io import BytesIO
+
+import streamlit as st
+from gtts import gTTS
+
+from conversation import estimate_tokens
+from resilience import CircuitOpenError, call_with_retry
+from usage import message_usage
+
+
+class TurnCancelled(Exception):
+    """Raised inside a pipeline stage once its turn has been cancelled"""
+
+
+class Turn:
+    """Cooperative cancellation handle for one question -> reply -> audio pipeline"""
+    def __init__(self):
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise TurnCancelled()
+
+
+def start_turn():
+    """Cancel whatever turn is still in flight and begin a new one"""
+    cancel_active_turn()
+    st.session_state.active_turn = Turn()
+    return st.session_state.active_turn
+
+
+def cancel_active_turn():
+    if st.session_state.active_turn is not None:
+        st.session_state.active_turn.cancel()
+        st.session_state.active_turn = None
+
+
+@contextmanager
+def pipeline_stage(name, turn):
+    """Count a stage as completed or cancelled in the session's pipeline stats"""
+    stats = st.session_state.pipeline_stats
+    try:
+        yield
+    except CircuitOpenError:
+        # The backend was known to be down, so the stage never ran
+        stats[f"{name}_skipped"] = stats.get(f"{name}_skipped", 0) + 1
+        raise
+    except TurnCancelled:
+        stats[f"{name}_cancelled"] = stats.get(f"{name}_cancelled", 0) + 1
+        raise
+    except Exception:
+        stats[f"{name}_failed"] = stats.get(f"{name}_failed", 0) + 1
+        raise
+    except BaseException:
+        # Streamlit stops a superseded run at its next UI update by raising a
+        # control exception; treat that as cancellation and let it propagate
+        turn.cancel()
+        stats[f"{name}_cancelled"] = stats.get(f"{name}_cancelled", 0) + 1
+        raise
+    else:
+        stats[f"{name}_completed"] = stats.get(f"{name}_completed", 0) + 1
+
+
+def record_llm_usage(system_prompt, model_name, question, answer, message, seconds,
+                     usage=None, history_tokens=None):
+    """Meter one LLM call, estimating tokens if the response carried no usage
+
+    seconds is the wall-clock time the caller waited; Groq's own server time
+    is recorded separately when the response reports it.
+
+    usage and history_tokens default to the session's meter and history; pass
+    them explicitly when metering off the script thread.
+    """
+    if usage is None:
+        usage = st.session_state.usage
+    input_tokens, output_tokens, server_seconds = message_usage(message)
+    estimated = input_tokens is None or output_tokens is None
+    if estimated:
+        if history_tokens is None:
+            history_tokens = st.session_state.conversation.total_tokens
+        input_tokens = estimate_tokens(system_prompt) + history_tokens + estimate_tokens(question)
+        output_tokens = estimate_tokens(answer)
+    usage.record_llm(model_name, input_tokens, output_tokens, seconds, estimated, server_seconds)
+
+
+def stream_reply(chain, question, system_prompt, model_name, breaker, deadline, turn=None, on_chunk=None):
+    """Stream the reply to question through breaker, then meter it
+
+    The chain must yield message chunks (no StrOutputParser) so the usage
+    they carry can be metered. on_chunk gets the answer so far after every
+    chunk; the turn is checked before each attempt and between chunks.
+    """
+    def stream_answer():
+        # The question is sent once, via the prompt; history holds only prior turns
+        stream = chain.stream({
+            "question": question,
+            "chat_history": st.session_state.conversation.chat_history
+        })
+        answer = ""
+        message = None
+        started = time.monotonic()
+        try:
+            for chunk in stream:
+                if turn is not None:
+                    turn.check()
+                message = chunk if message is None else message + chunk
+                answer += chunk.content
+                if on_chunk is not None:
+                    on_chunk(answer)
+        finally:
+            # Drops the HTTP stream right away when the turn is abandoned
+            stream.close()
+        record_llm_usage(system_prompt, model_name, question, answer, message, time.monotonic() - started)
+        return answer
+
+    return call_with_retry(stream_answer, breaker, deadline=deadline,
+                           before_attempt=turn.check if turn is not None else None,
+                           ignore=(TurnCancelled,))
+
+
+def fetch_speech(text, breaker, timeout, on_part=None):
+    """gTTS audio for text through breaker, retrying for up to twice timeout"""
+    def fetch_audio():
+        tts = gTTS(text=text, lang='en', slow=False, timeout=timeout)
+        audio_bytes = BytesIO()
+        # gTTS fetches long text in several requests; on_part runs between them
+        for part in tts.stream():
+            audio_bytes.write(part)
+            if on_part is not None:
+                on_part()
+        return audio_bytes.getvalue()
+
+    return call_with_retry(fetch_audio, breaker, deadline=2 * timeout, ignore=(TurnCancelled,))
+
+
+def mp3_duration(audio_bytes):
+    """Approximate playback length of gTTS output (32 kbit/s MP3)"""
+    return len(audio_bytes) * 8 / 32000
+
+
+def try_speech(text_to_speech, text, turn=None, on_part=None):
+    """Audio from text_to_speech(text, on_part), or None once the user is told why
+
+    TTS trouble never fails the turn: an open breaker degrades the reply to
+    text only and any other error is shown. With a turn the call is counted
+    as its "tts" stage, so skips and failures show up in the pipeline stats.
+    """
+    try:
+        with pipeline_stage("tts", turn) if turn is not None else nullcontext():
+            return text_to_speech(text, on_part)
+    except TurnCancelled:
+        raise
+    except CircuitOpenError:
+        st.info("🔇 Voice is temporarily unavailable, replying in text only.")
+    except Exception as e:
+        st.error(f"Text-to-speech failed: {e}")
+    return None
+
+
+def backend_health_panel(breakers):
+    with st.expander("Backend health"):
+        for breaker in breakers.values():
+            health = breaker.snapshot()
+            st.markdown(f"**{breaker.name}**: {health['state'].replace('_', '-')}")
+            st.caption(f"{health['calls']} calls, {health['failures']} failures, {health['retries']} retries, "
+                       f"{health['rejected']} rejected, opened {health['opened']}×")
+
+
+def usage_panel(usage):
+    with st.expander("Usage & cost"):
+        usage_report = usage.to_dict()
+        for row in usage_report["rows"]:
+            if row["stage"] == "llm":
+                detail = f"{row['input_tokens']} in / {row['output_tokens']} out tokens"
+            elif row["stage"] == "stt":
+                detail = f"{row['audio_seconds']:.1f}s of audio"
+            else:
+                detail = f"{row['characters']} characters"
+            cost = "n/a" if row["cost_usd"] is None else f"${row['cost_usd']:.5f}"
+            st.markdown(f"**{row['stage'].upper()}** · {row['model']}")
+            st.caption(f"{row['calls']} calls, {detail}, {cost}")
+        st.markdown(f"Session total: ${usage_report['totals']['cost_usd']:.5f}")
+        st.download_button("Export usage (JSON)", json.dumps(usage_report, indent=2),
+                           file_name=f"usage-{usage_report['session_id']}.json", mime="application/json")
+
+
+def pipeline_stats_panel(stats):
+    with st.expander("Pipeline stats"):
+        for name, count in sorted(stats.items()):
+            st.markdown(f"{name.replace('_', ' ').capitalize()}: {count}")
+        launched = stats.get("speculation_launched", 0)
+        if launched:
+            used = stats.get("speculation_used", 0)
+            st.markdown(f"Wasted speculation: {(launched - used) / launched:.0%}")
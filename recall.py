@@ -0,0 +1,116 @@
+"""Local answers for recall and repeat questions, with no LLM round trip
+
+Facts are pulled from the user's own statements with a few fixed patterns;
+questions, hypotheticals and negated values are not facts. A question is
+answered here only when it clearly asks for one of those facts (or for a
+repeat) and the fact is known; anything else returns None and goes to the
+model as usual.
+"""
+import re
+
+_STOP = r"(?=\s*(?:[.,!?;]|\band\b|\bbut\b|\bnow\b|\bthese days\b|$))"
+
+FACT_PATTERNS = [
+    ("name", re.compile(r"\b(?:my name is|my name's|i am called|i'm called)\s+([a-z][a-z'-]*(?: [a-z][a-z'-]*){0,2})"
+                        + _STOP, re.IGNORECASE)),
+    ("location", re.compile(r"\bi(?: live in| am from|'m from| come from)\s+(.+?)" + _STOP, re.IGNORECASE)),
+    ("job", re.compile(r"\b(?:i work as|my job is)\s+(?:an? )?(.+?)" + _STOP, re.IGNORECASE)),
+    ("goal", re.compile(r"\bmy goal is to\s+(.+?)" + _STOP, re.IGNORECASE)),
+]
+FAVORITE_PATTERN = re.compile(r"\bmy favou?rite (\w+(?: \w+)?) is\s+(.+?)" + _STOP, re.IGNORECASE)
+
+# Questions and hypotheticals mention facts without stating them
+NOT_A_STATEMENT = re.compile(r"^(?:what if|if|suppose|imagine|let's say)\b", re.IGNORECASE)
+NEGATIONS = {"not", "never", "no", "nothing", "none", "neither"}
+# Words a name never contains; "my name is just a number" is not a name
+NAME_STOP_WORDS = NEGATIONS | {"a", "an", "the", "just", "really", "very", "so", "too", "also", "actually",
+                               "that", "this", "it", "something", "important", "secret", "private"}
+
+QUESTION_PATTERNS = [
+    ("name", re.compile(r"^(?:what(?:'s| is) my name|who am i|do you (?:remember|know) my name)$")),
+    ("location", re.compile(r"^(?:where (?:do i live|am i from|do i come from))$")),
+    ("job", re.compile(r"^(?:what(?:'s| is) my job|what do i do(?: for (?:a )?(?:living|work))?)$")),
+    ("goal", re.compile(r"^what(?:'s| is) my goal$")),
+    ("repeat", re.compile(r"^(?:(?:can|could) you )?(?:repeat(?: that)?|say (?:that|it) again|what did you (?:just )?say)(?: please)?$")),
+    ("last_question", re.compile(r"^what did i (?:just )?(?:say|ask)$")),
+]
+FAVORITE_QUESTION = re.compile(r"^what(?:'s| is) my favou?rite (\w+(?: \w+)?)$")
+
+
+def clean(text):
+    """Collapse whitespace and curly apostrophes, keeping the user's casing"""
+    return re.sub(r"\s+", " ", text.replace("’", "'")).strip()
+
+
+def normalize(text):
+    return re.sub(r"[\s.!?]+$", "", clean(text).lower())
+
+
+def sentence(value):
+    """value as a sentence; a first word with its own casing ("iOS") is kept as is"""
+    first_word = value.split(" ", 1)[0]
+    if first_word.islower():
+        value = value[:1].upper() + value[1:]
+    return f"{value}."
+
+
+def statements(text):
+    """Sentences of text that state something, skipping questions and hypotheticals"""
+    for part in re.split(r"(?<=[.!?])\s+", clean(text)):
+        if part and not part.endswith("?") and not NOT_A_STATEMENT.match(part):
+            yield part
+
+
+def confident(key, value):
+    words = value.lower().split()
+    if not words or words[0] in NEGATIONS:
+        return False
+    if key == "name":
+        return not any(word in NAME_STOP_WORDS for word in words)
+    return True
+
+
+def extract_facts(text, facts):
+    """Update facts in place with anything the user states about themselves
+
+    The last statement of a fact wins; a negated one ("my favorite color is
+    not blue") forgets it rather than guessing.
+    """
+    # Matched case-insensitively but stored as typed, so "McDonald" stays "McDonald"
+    for part in statements(text):
+        found = [(match.start(), key, match.group(1))
+                 for key, pattern in FACT_PATTERNS for match in pattern.finditer(part)]
+        found += [(match.start(), f"favorite {match.group(1).lower()}", match.group(2))
+                  for match in FAVORITE_PATTERN.finditer(part)]
+        for _, key, value in sorted(found):
+            value = value.strip()
+            if confident(key, value):
+                facts[key] = value
+            else:
+                facts.pop(key, None)
+
+
+def answer_locally(question, facts, messages):
+    """Persona-style answer for a recall or repeat question, or None"""
+    normalized = normalize(question)
+    match = FAVORITE_QUESTION.match(normalized)
+    if match:
+        value = facts.get(f"favorite {match.group(1)}")
+        return sentence(value) if value else None
+    for key, pattern in QUESTION_PATTERNS:
+        if not pattern.match(normalized):
+            continue
+        if key == "repeat":
+            return next((m["content"] for m in reversed(messages) if m["role"] == "assistant"), None)
+        if key == "last_question":
+            last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), None)
+            return f"You asked: “{last}”" if last else None
+        value = facts.get(key)
+        if not value:
+            return None
+        if key == "name":
+            return f"You are {value}."
+        if key == "goal":
+            return f"To {value}."
+        return sentence(value)
+    return None
@@ -0,0 +1,146 @@
+"""Retries and circuit breakers for the Groq and gTTS backends
+
+Shared by app.py and test.py. Per-call deadlines are set on the clients
+themselves (request timeouts); this module bounds the total time spent
+retrying and fails fast while a backend is unhealthy.
+"""
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open"""
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable, retrying in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_transient(exc):
+    """Timeouts, connection failures, 429s and 5xx responses are worth retrying
+
+    Client errors that wrap a network failure are judged by what they wrap:
+    gTTS raises a bare gTTSError (no response) from inside its handler for
+    the requests Timeout or ConnectionError, so the cause/context chain is
+    followed until something decides.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        status = getattr(exc, "status_code", None)
+        for attr in ("response", "rsp"):
+            if status is None:
+                status = getattr(getattr(exc, attr, None), "status_code", None)
+        if status is not None:
+            return status == 429 or status >= 500
+        if isinstance(exc, (TimeoutError, ConnectionError)):
+            return True
+        name = type(exc).__name__.lower()
+        if "timeout" in name or "connection" in name:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class CircuitBreaker:
+    """Opens after consecutive transient failures, then lets one probe through"""
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.stats = {"calls": 0, "successes": 0, "failures": 0, "retries": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        with self.lock:
+            if self.state == "open":
+                retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, retry_in)
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self.probing:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self.probing = True
+            self.stats["calls"] += 1
+
+    def record_success(self):
+        with self.lock:
+            self.stats["successes"] += 1
+            self.consecutive_failures = 0
+            self.state = "closed"
+            self.probing = False
+
+    def record_failure(self, transient):
+        with self.lock:
+            self.stats["failures"] += 1
+            self.probing = False
+            if not transient:
+                if self.state == "half_open":
+                    self.state = "closed"
+                return
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.stats["opened"] += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Forget an attempt that ended without a verdict (e.g. it was cancelled)"""
+        with self.lock:
+            self.probing = False
+
+    def is_open(self):
+        with self.lock:
+            return self.state == "open" and time.monotonic() < self.opened_at + self.reset_timeout
+
+    def snapshot(self):
+        with self.lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive_failures, **self.stats}
+
+
+def call_with_retry(fn, breaker, attempts=3, base_delay=0.25, max_delay=2.0, deadline=None,
+                    before_attempt=None, ignore=()):
+    """Call fn() through breaker, retrying transient errors with full-jitter backoff
+
+    deadline caps the total seconds spent including backoff; a retry that
+    could not start before it is skipped and the last error is raised.
+    before_attempt runs ahead of every attempt, e.g. to check for cancellation.
+    Exceptions in ignore (such as cancellations) propagate without counting
+    against the backend.
+    """
+    start = time.monotonic()
+    for attempt in range(attempts):
+        if before_attempt is not None:
+            before_attempt()
+        breaker.before_call()
+        try:
+            result = fn()
+        except ignore:
+            breaker.release()
+            raise
+        except Exception as e:
+            transient = is_transient(e)
+            breaker.record_failure(transient)
+            if not transient or attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if deadline is not None and time.monotonic() - start + delay >= deadline:
+                raise
+            with breaker.lock:
+                breaker.stats["retries"] += 1
+            time.sleep(delay)
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
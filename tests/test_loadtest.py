@@ -0,0 +1,21 @@
+import pytest
+
+from loadtest import percentile, require_internals
+
+
+def test_percentile_is_nearest_rank():
+    samples = list(range(1, 14))
+    assert percentile(samples, 50) == 7
+    assert percentile(samples, 95) == 13
+    assert percentile(samples, 99) == 13
+    assert percentile([5], 50) == 5
+    assert percentile([3, 1, 2, 4], 25) == 1
+
+
+def test_missing_internals_fail_clearly():
+    class Runner:
+        request_rerun = None
+
+    require_internals("Profiling sends", (Runner, "request_rerun"))
+    with pytest.raises(RuntimeError, match=r"Runner\._requests"):
+        require_internals("Profiling sends", (Runner, "_requests"))
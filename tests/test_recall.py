@@ -0,0 +1,104 @@
+import pytest
+
+from recall import answer_locally, extract_facts
+
+
+def facts_from(*texts):
+    facts = {}
+    for text in texts:
+        extract_facts(text, facts)
+    return facts
+
+
+@pytest.mark.parametrize("text", [
+    "I'm from Paris.",
+    "I’m from Paris.",
+    "I am from Paris, originally.",
+    "I live in Paris and love it.",
+    "i come from Paris",
+])
+def test_location(text):
+    assert facts_from(text)["location"] == "Paris"
+
+
+def test_name_keeps_its_casing():
+    facts = facts_from("Hi, my name is McDonald.")
+    assert facts["name"] == "McDonald"
+    assert answer_locally("What's my name?", facts, []) == "You are McDonald."
+
+
+def test_name_is_stored_as_typed():
+    assert facts_from("my name is alex")["name"] == "alex"
+    assert facts_from("I'm called O'Neil-Smith!")["name"] == "O'Neil-Smith"
+
+
+@pytest.mark.parametrize("text", [
+    "Can you call me later?",
+    "Please call me tomorrow.",
+    "Don't call me that.",
+])
+def test_call_me_is_not_a_name(text):
+    assert "name" not in facts_from(text)
+
+
+def test_job_goal_and_favorites():
+    facts = facts_from("I work as an iOS developer and my goal is to ship an app.",
+                       "My favorite Color is deep blue.")
+    assert answer_locally("What do I do for a living?", facts, []) == "iOS developer."
+    assert answer_locally("What is my goal?", facts, []) == "To ship an app."
+    assert answer_locally("What's my favorite color?", facts, []) == "Deep blue."
+
+
+def test_unknown_fact_goes_to_the_model():
+    assert answer_locally("What's my name?", {}, []) is None
+    assert answer_locally("Where do I live?", facts_from("I'm from Paris."), []) == "Paris."
+    assert answer_locally("How do I design a great product?", facts_from("My name is Alex."), []) is None
+
+
+def test_repeat_and_last_question():
+    messages = [
+        {"role": "user", "content": "How should a small team focus?"},
+        {"role": "assistant", "content": "Say no to a thousand things."},
+    ]
+    assert answer_locally("Could you repeat that please", {}, messages) == "Say no to a thousand things."
+    assert answer_locally("What did I just ask?", {}, messages) == "You asked: “How should a small team focus?”"
+    assert answer_locally("Say that again", {}, []) is None
+
+
+def test_multi_word_name():
+    facts = facts_from("My name is John Smith.")
+    assert answer_locally("What's my name?", facts, []) == "You are John Smith."
+
+
+@pytest.mark.parametrize("text", [
+    "My name is not important, tell me about design.",
+    "My name is just a number here.",
+])
+def test_non_names_are_not_stored(text):
+    facts = facts_from(text)
+    assert "name" not in facts
+    assert answer_locally("What's my name?", facts, []) is None
+
+
+@pytest.mark.parametrize("text", [
+    "What if I live in a world without phones?",
+    "If I live in Tokyo, what should I build?",
+    "Do you think my favorite color is blue?",
+])
+def test_questions_and_hypotheticals_state_nothing(text):
+    assert facts_from(text) == {}
+
+
+def test_statement_in_a_message_with_a_question():
+    assert facts_from("I live in Berlin. What should I build?")["location"] == "Berlin"
+
+
+def test_last_statement_wins():
+    assert facts_from("I'm from Paris but I live in Berlin now.")["location"] == "Berlin"
+    assert facts_from("My name is Alex.", "Sorry, my name is Sam.")["name"] == "Sam"
+
+
+def test_negation_forgets_the_fact():
+    facts = facts_from("My favorite color is blue.", "Actually my favorite color is not blue.")
+    assert "favorite color" not in facts
+    assert answer_locally("What's my favorite color?", facts, []) is None
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+from gtts import gTTS
+from gtts.tts import gTTSError
+
+from resilience import CircuitBreaker, CircuitOpenError, call_with_retry, is_transient
+
+
+def gtts_error(cause=None, response=None):
+    """A gTTSError raised the way gTTS raises it, from inside its except block"""
+    tts = gTTS("hello", lang_check=False)
+    try:
+        try:
+            if cause is not None:
+                raise cause
+            raise requests.exceptions.HTTPError()
+        except requests.exceptions.RequestException:
+            raise gTTSError(tts=tts, response=response)
+    except gTTSError as e:
+        return e
+
+
+@pytest.mark.parametrize("cause", [
+    requests.exceptions.ReadTimeout("read timed out"),
+    requests.exceptions.ConnectTimeout("connect timed out"),
+    requests.exceptions.ConnectionError("connection refused"),
+])
+def test_gtts_network_failures_are_transient(cause):
+    error = gtts_error(cause)
+    assert error.rsp is None
+    assert is_transient(error)
+
+
+@pytest.mark.parametrize("status, transient", [(429, True), (500, True), (503, True), (403, False), (200, False)])
+def test_gtts_http_errors_judged_by_status(status, transient):
+    assert is_transient(gtts_error(response=SimpleNamespace(status_code=status, reason=""))) is transient
+
+
+def test_wrapped_non_network_error_is_not_transient():
+    assert not is_transient(gtts_error(requests.exceptions.InvalidURL("bad url")))
+    assert not is_transient(ValueError("bad input"))
+
+
+def test_explicit_cause_is_followed():
+    try:
+        try:
+            raise TimeoutError()
+        except TimeoutError as e:
+            raise RuntimeError("upload failed") from e
+    except RuntimeError as e:
+        assert is_transient(e)
+
+
+def test_gtts_timeouts_are_retried_and_open_the_breaker():
+    breaker = CircuitBreaker("gTTS", failure_threshold=3)
+    calls = []
+
+    def fetch_audio():
+        calls.append(1)
+        raise gtts_error(requests.exceptions.ReadTimeout())
+
+    with pytest.raises(gTTSError):
+        call_with_retry(fetch_audio, breaker, attempts=3, base_delay=0)
+    assert len(calls) == 3
+    assert breaker.snapshot()["retries"] == 2
+    assert breaker.is_open()
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(fetch_audio, breaker)
+    assert len(calls) == 3
+
+
+def test_non_transient_error_is_not_retried():
+    breaker = CircuitBreaker("gTTS", failure_threshold=1)
+
+    def fetch_audio():
+        raise gtts_error(response=SimpleNamespace(status_code=403, reason="Forbidden"))
+
+    with pytest.raises(gTTSError):
+        call_with_retry(fetch_audio, breaker, attempts=3, base_delay=0)
+    assert breaker.snapshot()["calls"] == 1
+    assert not breaker.is_open()
+
+
+def test_half_open_breaker_closes_after_a_successful_probe():
+    breaker = CircuitBreaker("Groq LLM", failure_threshold=1, reset_timeout=0.0)
+    breaker.before_call()
+    breaker.record_failure(transient=True)
+    assert breaker.state == "open"
+    assert call_with_retry(lambda: "ok", breaker) == "ok"
+    assert breaker.state == "closed"
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from usage import UsageMeter, message_usage
+
+
+def test_message_usage_reads_tokens_and_server_time():
+    message = SimpleNamespace(
+        usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150},
+        response_metadata={"token_usage": {"total_time": 0.25}},
+    )
+    assert message_usage(message) == (120, 30, 0.25)
+
+
+def test_streamed_chunks_carry_no_server_time():
+    chunk = AIMessageChunk(content="Hi", usage_metadata={"input_tokens": 12, "output_tokens": 3, "total_tokens": 15},
+                           response_metadata={"model_provider": "groq"})
+    assert message_usage(chunk) == (12, 3, None)
+
+
+def test_wall_and_server_time_are_kept_apart():
+    meter = UsageMeter()
+    meter.record_llm("llama-3.1-8b-instant", 10, 10, seconds=0.8)
+    meter.record_llm("llama-3.1-8b-instant", 10, 10, seconds=0.5, server_seconds=0.1)
+    row = meter.rows[("llm", "llama-3.1-8b-instant")]
+    assert row["seconds"] == pytest.approx(1.3)
+    assert row["server_seconds"] == pytest.approx(0.1)
+
+
+def test_message_usage_without_metadata():
+    assert message_usage(None) == (None, None, None)
+    assert message_usage(SimpleNamespace(usage_metadata=None, response_metadata={})) == (None, None, None)
+
+
+def test_rows_accumulate_per_stage_and_model():
+    meter = UsageMeter()
+    meter.record_llm("llama-3.1-8b-instant", 1000, 200, seconds=0.5)
+    meter.record_llm("llama-3.1-8b-instant", 500, 100, estimated=True)
+    meter.record_llm("llama-3.3-70b-versatile", 10, 10)
+    row = meter.rows[("llm", "llama-3.1-8b-instant")]
+    assert (row["calls"], row["estimated_calls"], row["input_tokens"], row["output_tokens"]) == (2, 1, 1500, 300)
+    assert row["seconds"] == 0.5
+    assert len(meter.rows) == 2
+
+
+def test_costs():
+    meter = UsageMeter()
+    meter.record_llm("llama-3.1-8b-instant", 1_000_000, 1_000_000)
+    meter.record_stt("whisper-large-v3-turbo", 3600)
+    meter.record_tts(5000)
+    costs = {row["stage"]: UsageMeter.cost(row) for row in meter.rows.values()}
+    assert costs["llm"] == pytest.approx(0.05 + 0.08)
+    assert costs["stt"] == pytest.approx(0.04)
+    assert costs["tts"] == 0.0
+    assert meter.total_cost() == pytest.approx(0.17)
+
+
+def test_unknown_model_is_metered_without_cost():
+    meter = UsageMeter()
+    meter.record_llm("groq/compound", 100, 100)
+    meter.record_llm("llama-3.1-8b-instant", 1_000_000, 0)
+    report = meter.to_dict()
+    by_model = {row["model"]: row for row in report["rows"]}
+    assert by_model["groq/compound"]["cost_usd"] is None
+    assert report["totals"]["input_tokens"] == 1_000_100
+    assert report["totals"]["cost_usd"] == pytest.approx(0.05)
+
+
+def test_export_totals():
+    meter = UsageMeter()
+    meter.record_stt("whisper-large-v3-turbo", 12.5)
+    meter.record_tts(42, seconds=1.0)
+    report = meter.to_dict()
+    assert report["session_id"] == meter.session_id
+    assert report["totals"]["audio_seconds"] == 12.5
+    assert report["totals"]["characters"] == 42
+    assert report["totals"]["input_tokens"] == 0
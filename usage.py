@@ -0,0 +1,127 @@
+"""Token, audio and character usage with cost estimates, per model and stage
+
+Shared by app.py and test.py. Each session keeps one UsageMeter; LLM calls
+record the token counts ChatGroq reports (or an estimate when it reports
+none), STT records seconds of audio and TTS records characters synthesized.
+Background work (speculative prefetches) may record from worker threads.
+Every row's "seconds" is client wall-clock time; LLM rows also sum the
+server time Groq reports, which only non-streamed calls carry.
+
+The "Usage & cost" panel (pipeline.usage_panel) sits in test.py's sidebar;
+app.py renders it inside its chat fragment so every send refreshes it.
+"""
+import threading
+import time
+import uuid
+
+# USD per million tokens (input, output). Groq list prices at the time of
+# writing; adjust to your plan. Models missing here are metered without cost.
+TOKEN_PRICES = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "meta-llama/llama-4-scout-17b-16e-instruct": (0.11, 0.34),
+    "meta-llama/llama-4-maverick-17b-128e-instruct": (0.20, 0.60),
+    "qwen/qwen3-32b": (0.29, 0.59),
+    "moonshotai/kimi-k2-instruct-0905": (1.00, 3.00),
+}
+# USD per hour of transcribed audio
+AUDIO_PRICES = {
+    "whisper-large-v3-turbo": 0.04,
+}
+# USD per million characters; gTTS is free
+CHARACTER_PRICES = {
+    "gtts": 0.0,
+}
+
+
+def message_usage(message):
+    """(input tokens, output tokens, server seconds) reported on an LLM message
+
+    Server seconds come from Groq's token_usage total_time, which invoke()
+    results carry. Streamed chunks carry only the token counts (langchain-groq
+    drops the rest of the x_groq usage payload), so for them it is None.
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("input_tokens"), usage.get("output_tokens"), token_usage.get("total_time")
+
+
+class UsageMeter:
+    """Running usage totals for one session, keyed by (stage, model)"""
+    def __init__(self):
+        self.session_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.rows = {}
+
+    def _row(self, stage, model):
+        key = (stage, model)
+        if key not in self.rows:
+            self.rows[key] = {
+                "stage": stage, "model": model, "calls": 0, "estimated_calls": 0,
+                "input_tokens": 0, "output_tokens": 0, "audio_seconds": 0.0,
+                "characters": 0, "seconds": 0.0, "server_seconds": 0.0,
+            }
+        return self.rows[key]
+
+    def record_llm(self, model, input_tokens, output_tokens, seconds=None, estimated=False, server_seconds=None):
+        with self.lock:
+            row = self._row("llm", model)
+            row["calls"] += 1
+            row["estimated_calls"] += int(estimated)
+            row["input_tokens"] += input_tokens
+            row["output_tokens"] += output_tokens
+            row["seconds"] += seconds or 0.0
+            row["server_seconds"] += server_seconds or 0.0
+
+    def record_stt(self, model, audio_seconds, seconds=None):
+        with self.lock:
+            row = self._row("stt", model)
+            row["calls"] += 1
+            row["audio_seconds"] += audio_seconds
+            row["seconds"] += seconds or 0.0
+
+    def record_tts(self, characters, seconds=None, model="gtts"):
+        with self.lock:
+            row = self._row("tts", model)
+            row["calls"] += 1
+            row["characters"] += characters
+            row["seconds"] += seconds or 0.0
+
+    @staticmethod
+    def cost(row):
+        """Estimated USD for one row, or None if the model has no known price"""
+        if row["stage"] == "llm":
+            if row["model"] not in TOKEN_PRICES:
+                return None
+            input_price, output_price = TOKEN_PRICES[row["model"]]
+            return (row["input_tokens"] * input_price + row["output_tokens"] * output_price) / 1e6
+        if row["stage"] == "stt":
+            price = AUDIO_PRICES.get(row["model"])
+            return None if price is None else row["audio_seconds"] / 3600 * price
+        price = CHARACTER_PRICES.get(row["model"])
+        return None if price is None else row["characters"] * price / 1e6
+
+    def total_cost(self):
+        with self.lock:
+            rows = list(self.rows.values())
+        return sum(self.cost(row) or 0.0 for row in rows)
+
+    def to_dict(self):
+        """Machine-readable snapshot: per (stage, model) rows plus session totals"""
+        with self.lock:
+            rows = [{**row, "cost_usd": self.cost(row)} for row in self.rows.values()]
+        llm_rows = [row for row in rows if row["stage"] == "llm"]
+        return {
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "exported_at": time.time(),
+            "rows": rows,
+            "totals": {
+                "input_tokens": sum(row["input_tokens"] for row in llm_rows),
+                "output_tokens": sum(row["output_tokens"] for row in llm_rows),
+                "audio_seconds": sum(row["audio_seconds"] for row in rows),
+                "characters": sum(row["characters"] for row in rows),
+                "cost_usd": sum(row["cost_usd"] or 0.0 for row in rows),
+            },
+        }